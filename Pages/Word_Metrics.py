@@ -2,79 +2,93 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import io
-import base64
-import random
 
 st.set_page_config(page_title="Classifier Word Metrics", layout="wide")
 st.title("📊 Classifier Word Metrics")
 st.markdown("Transform binary classifier results into continuous scores and ID-level metrics.")
 
+# Same loader as load_csv in streamlit_app.py (this page is also deployed on its own, so it
+# cannot import it); change both together. Bounded because entries are shared by all sessions.
+@st.cache_data(show_spinner=False, max_entries=8, ttl="1h")
+def load_csv(data: bytes, usecols: tuple[str, ...]) -> pd.DataFrame:
+    # Default C engine, the same parser as the header read, so header names (e.g. "Unnamed: 0",
+    # "ID.1"), quoted newlines and short rows behave as before; usecols still skips the rest
+    return pd.read_csv(io.BytesIO(data), usecols=list(usecols))
+
 # --- Upload CSV ---
 st.header("1. Upload Your Data")
 uploaded_file = st.file_uploader("Upload CSV file", type=["csv"])
 
 if uploaded_file:
     try:
-        df = pd.read_csv(uploaded_file)
-        st.success(f"Uploaded {uploaded_file.name} with {len(df)} rows.")
+        # Header only for the selections; the selected columns are parsed on Process
+        data = uploaded_file.getvalue()
+        csv_columns = pd.read_csv(io.BytesIO(data), nrows=0).columns.tolist()
+        st.success(f"Uploaded {uploaded_file.name} with {len(csv_columns)} columns.")
 
         # Column selections
-        id_column = st.selectbox("Select ID Column", options=df.columns, index=0)
-        text_column = st.selectbox("Select Text/Statement Column", options=df.columns, index=1)
-        classifier_columns = st.multiselect("Select Classifier Columns", options=[col for col in df.columns if col not in [id_column, text_column]])
+        id_column = st.selectbox("Select ID Column", options=csv_columns, index=0)
+        text_column = st.selectbox("Select Text/Statement Column", options=csv_columns, index=1)
+        classifier_columns = st.multiselect("Select Classifier Columns", options=[col for col in csv_columns if col not in [id_column, text_column]])
 
         process_mode = st.radio("Processing Mode", ["Statement-level", "Aggregate to ID-level"])
 
         if st.button("🚀 Process Data"):
-            results = []
+            df = load_csv(data, tuple(dict.fromkeys([id_column, text_column, *classifier_columns])))
 
             if process_mode == "Statement-level":
-                for idx, row in df.iterrows():
-                    result = {
-                        "row_id": idx + 1,
-                        "id": row[id_column],
-                        "statement": row[text_column],
-                        "word_count": len(str(row[text_column]).split())
-                    }
-                    for col in classifier_columns:
-                        val = float(row.get(col, 0))
-                        is_positive = val > 0
-                        if is_positive:
-                            score = min(0.95, max(0.5, val + random.uniform(-0.15, 0.15)))
-                        else:
-                            score = max(0.05, min(0.5, random.uniform(0.05, 0.4)))
-                        result[f"{col}_binary"] = val
-                        result[f"{col}_continuous"] = round(score, 3)
-                        result[f"{col}_percentage"] = round(score * 100)
-                    results.append(result)
+                values = df[classifier_columns].to_numpy(dtype=np.float64)
+                rng = np.random.default_rng()
+                pos_noise = rng.uniform(-0.15, 0.15, size=values.shape)
+                neg_noise = rng.uniform(0.05, 0.4, size=values.shape)
+                # Positive values are jittered into [0.5, 0.95], the rest drawn into [0.05, 0.5]
+                continuous = np.where(values > 0, np.clip(values + pos_noise, 0.5, 0.95), np.clip(neg_noise, 0.05, 0.5))
+
+                columns = {
+                    "row_id": df.index + 1,
+                    "id": df[id_column].to_numpy(),
+                    "statement": df[text_column].to_numpy(),
+                    "word_count": df[text_column].astype(object).map(str).str.split().str.len().to_numpy(dtype=np.int32),
+                }
+                for k, col in enumerate(classifier_columns):
+                    columns[f"{col}_binary"] = values[:, k]
+                    columns[f"{col}_continuous"] = np.round(continuous[:, k], 3).astype(np.float32)
+                    columns[f"{col}_percentage"] = np.rint(continuous[:, k] * 100).astype(np.int8)
+                result_df = pd.DataFrame(columns)
 
             else:  # ID-level aggregation
-                grouped = df.groupby(id_column)
-                for uid, group in grouped:
-                    statements = group[text_column].astype(str).tolist()
-                    total_words = sum(len(s.split()) for s in statements)
-                    agg_result = {
-                        "id": uid,
-                        "total_word_count": total_words
-                    }
-                    for col in classifier_columns:
-                        values = group[col].astype(float)
-                        positive_ratio = (values > 0).sum() / len(values)
-                        word_count = int(round(total_words * positive_ratio))
-                        agg_result[f"{col}_word_count"] = word_count
-                        agg_result[f"{col}_percentage"] = round(positive_ratio * 100)
-                        agg_result[f"{col}_continuous_score"] = round(positive_ratio, 3)
-                    results.append(agg_result)
+                # One groupby pass each for the word totals and the positive ratios
+                keys = df[id_column]
+                word_count = df[text_column].astype(object).map(str).str.split().str.len()
+                totals = word_count.groupby(keys).sum()
+                positive = pd.DataFrame(df[classifier_columns].to_numpy(dtype=np.float64) > 0, index=df.index)
+                positive_ratio = positive.groupby(keys).mean().to_numpy()
+                ids = totals.index.to_numpy()
+                total_word_count = totals.to_numpy(dtype=np.int32)
+
+                columns = {
+                    "id": ids,
+                    "total_word_count": total_word_count,
+                }
+                for k, col in enumerate(classifier_columns):
+                    columns[f"{col}_word_count"] = np.round(total_word_count * positive_ratio[:, k]).astype(np.int32)
+                    columns[f"{col}_percentage"] = np.round(positive_ratio[:, k] * 100).astype(np.int8)
+                    columns[f"{col}_continuous_score"] = np.round(positive_ratio[:, k], 3).astype(np.float32)
+                result_df = pd.DataFrame(columns)
 
-            result_df = pd.DataFrame(results)
             st.success(f"Processed {len(result_df)} rows.")
             st.dataframe(result_df.head(10), use_container_width=True)
 
             # --- Download CSV ---
-            csv = result_df.to_csv(index=False).encode('utf-8')
-            b64 = base64.b64encode(csv).decode()
-            href = f'<a href="data:file/csv;base64,{b64}" download="processed_results.csv">📥 Download Full Results CSV</a>'
-            st.markdown(href, unsafe_allow_html=True)
+            csv_buffer = io.BytesIO()
+            result_df.to_csv(csv_buffer, index=False, chunksize=50_000)
+            st.download_button(
+                "📥 Download Full Results CSV",
+                data=csv_buffer.getvalue(),
+                file_name="processed_results.csv",
+                mime="text/csv",
+                on_click="ignore",  # a rerun would clear the results, which only render on the Process click
+            )
 
     except Exception as e:
         st.error(f"Failed to read file: {e}")
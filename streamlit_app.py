@@ -1,7 +1,11 @@
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from itertools import repeat
 import json
 import re
 
+import hyperscan
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -42,6 +46,14 @@ DEFAULT_DICT = {
     "Fitness": ["workout", "fitness", "exercise", "gym", "training"],
 }
 
+# Carried through to the output when present in the upload
+OPTIONAL_COLUMNS = ["number_likes", "number_comments"]
+
+# Sentence splitting patterns, compiled up front and shared by every split
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+SENTENCE_OR_HASHTAG_BREAK = re.compile(r"(?<=[.!?])\s+|(?=#[^\s]+)")
+WHITESPACE_RUN = re.compile(r"\s+")
+
 # ──────────────────────────────  Sidebar ──────────────────────────────
 
 st.sidebar.markdown(
@@ -57,10 +69,11 @@ st.sidebar.markdown(
 
 ## 1️⃣  File upload
 st.sidebar.header("1️⃣  Upload your CSV")
-uploaded_file = st.sidebar.file_uploader(
-    "Choose an Instagram CSV file (≤200 MB)",
+uploaded_files = st.sidebar.file_uploader(
+    "Choose Instagram CSV files (≤200 MB each)",
     type=["csv"],
-    accept_multiple_files=False,
+    accept_multiple_files=True,
+    help="Multiple files are combined into one table, so they must share the same columns.",
 )
 
 st.sidebar.markdown("---")
@@ -78,10 +91,15 @@ try:
     keyword_dict = json.loads(dict_input)
     if not isinstance(keyword_dict, dict):
         raise ValueError("Dictionary root must be a JSON object (key → list).")
+    if not all(isinstance(kws, list) and all(isinstance(k, str) for k in kws) for kws in keyword_dict.values()):
+        raise ValueError("Each category must map to a list of keyword strings.")
 except (json.JSONDecodeError, ValueError) as e:
     st.sidebar.error(f"❌ {e}\nUsing default dictionary instead.")
     keyword_dict = DEFAULT_DICT
 
+# Normalise once here rather than per row: lowercase, drop empty and duplicate keywords
+keyword_dict = {cat: list(dict.fromkeys(k.lower() for k in kws if k)) for cat, kws in keyword_dict.items()}
+
 st.sidebar.markdown(
     """<small>🔧 Edit the JSON above to add/delete categories & keywords.</small>""",
     unsafe_allow_html=True,
@@ -110,54 +128,119 @@ include_hashtags = st.sidebar.checkbox("Treat hashtags as separate sentences", v
 
 # ──────────────────────────────  Helper functions  ──────────────────────────────
 
-def classify_sentence_with_context(index: int, sentences: list[str], window_size: int, kw_dict: dict) -> str:
-    start = max(0, index - window_size)
-    end = min(len(sentences), index + window_size + 1)
-    context_chunk = " ".join(sentences[start:end]).lower()
-    for cat, kws in kw_dict.items():
-        if any(k.lower() in context_chunk for k in kws):
-            return cat
-    return "Uncategorized"
-
-def process_dataframe(df: pd.DataFrame, id_col: str, text_col: str, kw_dict: dict, window_size: int, include_hashtags: bool) -> pd.DataFrame:
-    df = df.rename(columns={id_col: "ID", text_col: "Context"})
-    
+# Category names in dict order, plus one Hyperscan database over all their keywords
+KeywordPatterns = tuple[list[str], hyperscan.Database | None]
+
+def compile_patterns(kw_dict: dict) -> KeywordPatterns:
+    # Keywords arrive lowercased and non-empty from the sidebar parser; each is compiled
+    # as a literal whose match id is its category's index
+    categories = list(kw_dict)
+    keywords, ids = [], []
+    for idx, kws in enumerate(kw_dict.values()):
+        keywords.extend(k.encode("utf-8") for k in kws)
+        ids.extend([idx] * len(kws))
+    if not keywords:
+        return categories, None
+    database = hyperscan.Database()
+    database.compile(expressions=keywords, ids=ids, flags=hyperscan.HS_FLAG_SINGLEMATCH, literal=True)
+    return categories, database
+
+def match_categories(texts: pd.Series, patterns: KeywordPatterns) -> np.ndarray:
+    # Boolean (text × category) matrix from one Hyperscan pass per text.
+    # Captions repeat boilerplate, so each distinct text is scanned once.
+    categories, database = patterns
+    codes, uniques = pd.factorize(texts.str.lower())
+    hits = np.zeros((len(uniques), len(categories)), dtype=bool)
+    if database is not None:
+        scratch = hyperscan.Scratch(database)
+
+        def on_match(cat, start, end, flags, row):
+            hits[row, cat] = True
+
+        for row, text in enumerate(uniques):
+            database.scan(text.encode("utf-8"), match_event_handler=on_match, context=row, scratch=scratch)
+    return hits[codes]
+
+def first_category(hits: np.ndarray, categories: list[str]) -> np.ndarray:
+    # First matching category in dict order, else "Uncategorized"
+    if not categories:
+        return np.full(len(hits), "Uncategorized", dtype=object)
+    cats = np.array(categories, dtype=object)
+    return np.where(hits.any(axis=1), cats[hits.argmax(axis=1)], "Uncategorized")
+
+def process_dataframe(df: pd.DataFrame, id_col: str, text_col: str, patterns: KeywordPatterns, window_size: int, include_hashtags: bool) -> pd.DataFrame:
     # 只保留 number_likes 和 number_comments（如果存在）
     optional_columns = []
-    for col in ["number_likes", "number_comments"]:
-        if col in df.columns:
+    for col in OPTIONAL_COLUMNS:
+        if col in df.columns and col not in (id_col, text_col):
             optional_columns.append(col)
 
-    rows = []
-    for _, row in df.iterrows():
-        pattern = r"(?<=[.!?])\s+"
-        if include_hashtags:
-            pattern += r"|(?=#[^\s]+)"
-        sentences = re.split(pattern, str(row["Context"]))
-        cleaned = [re.sub(r"\s+", " ", s.strip()) for s in sentences]
-        cleaned = [s for s in cleaned if s and not re.fullmatch(r"[.!?]+", s)]
-        for i, s in enumerate(cleaned, start=1):
-            category = classify_sentence_with_context(i - 1, cleaned, window_size, kw_dict)
-            row_data = {
-                "ID": row["ID"],
-                "Context": row["Context"],
-                "Sentence ID": i,
-                "Statement": s,
-                "Category": category,
-            }
-            for col in optional_columns:
-                row_data[col] = row[col]
-            rows.append(row_data)
-    return pd.DataFrame(rows)
+    pattern = SENTENCE_OR_HASHTAG_BREAK if include_hashtags else SENTENCE_BREAK
+
+    # One row per sentence; the index is the source row's position
+    sentences = df[text_col].reset_index(drop=True).astype(object).map(str).str.split(pattern, regex=True).explode()
+    sentences = sentences.str.replace(WHITESPACE_RUN, " ", regex=True).str.strip()
+    # Drop empty and punctuation-only pieces in one mask: both are empty once .!? is stripped
+    sentences = sentences[sentences.str.strip(".!?").ne("")]
 
+    groups = sentences.groupby(level=0)
+    sentence_no = groups.cumcount().to_numpy()
+    hits = match_categories(sentences, patterns)
 
+    # Rolling context: OR the sentence hits over [i - window, i + window] within each post
+    if window_size:
+        pos = np.arange(len(sentences))
+        first = pos - sentence_no
+        lo = np.maximum(first, pos - window_size)
+        hi = np.minimum(first + groups.transform("size").to_numpy(), pos + window_size + 1)
+        cum = np.zeros((len(sentences) + 1, hits.shape[1]), dtype=np.int32)
+        np.cumsum(hits, axis=0, out=cum[1:])
+        hits = (cum[hi] - cum[lo]) > 0
+
+    rows = sentences.index.to_numpy()
+    result = {
+        "ID": df[id_col].to_numpy()[rows],
+        "Context": df[text_col].to_numpy()[rows],
+        "Sentence ID": sentence_no + 1,
+        "Statement": sentences.to_numpy(),
+        "Category": first_category(hits, patterns[0]),
+    }
+    for col in optional_columns:
+        result[col] = df[col].to_numpy()[rows]
+    return pd.DataFrame(result)
+
+
+# Entries hold whole parsed uploads and are shared by every session, so keep only a few and expire them.
+# Pages/Word_Metrics.py carries a copy of this loader; change both together.
+@st.cache_data(show_spinner=False, max_entries=8, ttl="1h")
+def load_csv(data: bytes, usecols: tuple[str, ...]) -> pd.DataFrame:
+    # Default C engine, the same parser as the header read, so header names (e.g. "Unnamed: 0",
+    # "ID.1"), quoted newlines and short rows behave as before; usecols still skips the rest
+    return pd.read_csv(BytesIO(data), usecols=list(usecols))
+
+# Shared across reruns and sessions; a Scratch is allocated per scan, so the database is only read.
+# Every distinct dictionary compiles its own database, so keep only a few and expire them.
+@st.cache_resource(show_spinner=False, max_entries=8, ttl="1h")
+def load_patterns(dict_json: str) -> KeywordPatterns:
+    return compile_patterns(json.loads(dict_json))
+
+# Keyed on the upload's bytes and the dictionary's JSON, so widget reruns reuse earlier results;
+# each entry is a full sentence-level result, so it is bounded like load_csv
+@st.cache_data(show_spinner=False, max_entries=4, ttl="1h")
+def transform_csv(files: tuple[bytes, ...], usecols: tuple[str, ...], id_col: str, text_col: str, dict_json: str, window_size: int, include_hashtags: bool) -> pd.DataFrame:
+    # The uploads parse on worker threads (the C tokenizer releases the GIL) while the patterns load here
+    with ThreadPoolExecutor() as pool:
+        frames = pool.map(load_csv, files, repeat(usecols))
+        patterns = load_patterns(dict_json)
+        raw_df = pd.concat(list(frames), ignore_index=True)
+    return process_dataframe(raw_df, id_col, text_col, patterns, window_size, include_hashtags)
 
 # ──────────────────────────────  How to Use  ──────────────────────────────
 
 st.markdown(
     """
 ### How to Use
-1. **Upload your CSV file** using the file uploader above  
+1. **Upload your CSV file(s)** using the file uploader above  
 2. **Select ID Column** – Choose the column that uniquely identifies each record  
 3. **Select Context Column** – Choose the column containing the text to be transformed  
 4. **Configure options** – Choose whether to include hashtags as separate sentences  
@@ -167,19 +250,48 @@ st.markdown(
 )
 
 # ──────────────────────────────  Main logic  ──────────────────────────────
-if uploaded_file is None:
-    st.info("👈  Start by uploading a CSV file from the sidebar.")
+if not uploaded_files:
+    st.info("👈  Start by uploading one or more CSV files from the sidebar.")
     st.stop()
 
-raw_df = pd.read_csv(uploaded_file)
+# Only the header is needed for column selection; the data is parsed on Transform
+csv_files = tuple(f.getvalue() for f in uploaded_files)
+try:
+    headers = [pd.read_csv(BytesIO(data), nrows=0).columns.tolist() for data in csv_files]
+except ValueError as e:  # includes UnicodeDecodeError for non-UTF-8 headers
+    st.error(f"❌ Could not read the uploaded CSV: {e}")
+    st.stop()
+
+# Column choices come from the first file and are applied to every file, so all headers must agree
+csv_columns = headers[0]
+mismatched = [f.name for f, cols in zip(uploaded_files, headers) if set(cols) != set(csv_columns)]
+if mismatched:
+    st.error(
+        f"❌ These files do not have the same columns as {uploaded_files[0].name}: {', '.join(mismatched)}. "
+        "Upload files that share one header."
+    )
+    st.stop()
 
 # Enable column selection once CSV is loaded
-id_column = st.sidebar.selectbox("Select ID column", options=raw_df.columns.tolist(), index=0)
-context_column = st.sidebar.selectbox("Select Context column", options=raw_df.columns.tolist(), index=1)
+id_column = st.sidebar.selectbox("Select ID column", options=csv_columns, index=0)
+context_column = st.sidebar.selectbox("Select Context column", options=csv_columns, index=1)
 
 if st.sidebar.button("⚙️  Transform"):
-    with st.spinner("Processing …"):
-        final_df = process_dataframe(raw_df, id_column, context_column, keyword_dict, window_size, include_hashtags)
+    try:
+        with st.spinner("Processing …"):
+            usecols = [id_column, context_column, *(c for c in OPTIONAL_COLUMNS if c in csv_columns)]
+            final_df = transform_csv(
+                csv_files,
+                tuple(dict.fromkeys(usecols)),
+                id_column,
+                context_column,
+                json.dumps(keyword_dict),
+                window_size,
+                include_hashtags,
+            )
+    except (ValueError, KeyError) as e:  # ParserError/UnicodeDecodeError, or a selected column gone missing
+        st.error(f"❌ Could not read the uploaded CSV: {e}")
+        st.stop()
 
     st.success("Processing complete!")
     st.subheader("Preview of processed data")